@@ -5,23 +5,28 @@ tmpl
 A general-purpose templating engine.
 '''
 
+import collections
+import concurrent.futures
+import errno
+import grp
 import logging
-import jinja2
 import os
-import shutil
+import pwd
+import stat
+import subprocess
 import sys
-import yaml
 from typing import Any
 
 from . import cli
-from . import config
-from . import jengine
 from . import utils
 
+YAML_EXTS = ('.yaml', '.yml')
+
 def bail(msg: str, ec: int):
     '''
     A handy function for reporting a critical issue.
     '''
+    cli.flush_stdout()
     cli.stderr(cli.fcolor(f'ERROR: {msg}', cli.C_RED))
     logging.critical(msg)
     sys.exit(ec)
@@ -38,11 +43,9 @@ def main():
     utils.setup_logging(args)
 
     # Log CLI arguments at debug level.
-    logging.debug('---------- CLI Arguments ----------')
-    dargs = vars(args)
-    for a in dargs:
-        logging.debug(a + ' : ' + str(dargs[a]))
-    logging.debug('-----------------------------------')
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        dargs = vars(args)
+        logging.debug('---------- CLI Arguments ----------\n%s', '\n'.join(f'{k} : {v}' for k, v in dargs.items()))
 
     # Set module global variables.
     logging.debug('--------- Global Variables --------')
@@ -54,6 +57,16 @@ def main():
 
     logging.info('Starting process...')
 
+    # Defer the heavier imports (Jinja2, PyYAML) until after argument parsing
+    # so trivial invocations like `tmpl --help` don't pay for them.
+    from . import config
+    from . import jengine
+
+    # Reset per-run resolver caches (relevant when tmpl is driven as a
+    # library rather than a one-shot CLI process).
+    utils._resolve_path.cache_clear()
+    config._REALPATH_CACHE.clear()
+
     # Set-up and validate the environment.
     template_dir = validate_environment(args)
     utils.TEMPLATE_DIR = template_dir
@@ -62,10 +75,10 @@ def main():
     # Parse the template configuration file.
     try:
         conf = config.parse(args.template_conf)
-        logging.debug('---------- Template Configuration File ----------')
-        for line in yaml.dump(conf).splitlines():
-            logging.debug(line)
-        logging.debug('-------------------------------------------------')
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            import yaml
+            dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+            logging.debug('---------- Template Configuration File ----------\n%s', yaml.dump(conf, Dumper=dumper))
     except Exception as e:
         bail(f'Unable to parse template configuration file - {e}', 3)
 
@@ -110,18 +123,30 @@ def main():
         # Handle STDIN
         translate_stdin(jinja_engine, conf)
 
+    cli.flush_stdout()
     logging.info('Process complete.')
     sys.exit(0)
 
 
+def _fail(msg: str, ec: int):
+    '''
+    Reports a critical issue encountered while translating a template.
+    '''
+    cli.flush_stdout()
+    cli.stderr(cli.fcolor(f'      ERROR: {msg}', cli.C_RED))
+    logging.critical(msg)
+    sys.exit(ec)
+
+
 def translate_stdin(jinja_engine: Any, conf: dict):
     '''
     Translates a Jinja string passed to STDIN to STDOUT.
     '''
     EC = 11
+    import jinja2
     logging.info('Translating from STDIN...')
     try:
-        stdin = sys.stdin.read()
+        stdin = sys.stdin.buffer.read().decode('utf-8')
     except Exception as e:
         bail(f'Unable to read from STDIN - {e}', EC)
     try:
@@ -134,7 +159,7 @@ def translate_stdin(jinja_engine: Any, conf: dict):
         bail(f'Unable to render template from STDIN - syntax error on line {e.lineno} - {e}', EC)
     except Exception as e:
         bail(f'Unable to render template from STDIN - {e}', EC)
-    print(rendered)
+    sys.stdout.write(rendered + '\n')
 
 
 def translate_templates(jinja_engine: Any, conf: dict, mapping: list[dict]):
@@ -143,78 +168,175 @@ def translate_templates(jinja_engine: Any, conf: dict, mapping: list[dict]):
     directory.
     '''
     EC = 8
+    import jinja2
+    import shutil
     cli.stdout(cli.fstep('Translating templates...'))
     logging.info('Translating templates...')
-    for spec in conf['files']:
-        cli.stdout(cli.fsubstep(spec['dst']))
-        spec_maps = [m for m in mapping if m['dst_key'] == spec['dst']]
-        for spec_map in spec_maps:
-            if spec_map['translate']:
-                logging.info(f"Translating \"{spec_map['full_src']}\" into \"{spec_map['full_wrk']}\"...")
-                logging.debug(f"Loading template \"{spec_map['rel_src']}\"...")
+    templates: dict = {}
+    created_dirs: set = set()
+    # Files containing none of the configured Jinja delimiters render to
+    # themselves (minus the trailing newline the lexer strips), so they can
+    # skip parsing and compilation entirely. Restricted to plain-LF content
+    # so the fast path is byte-identical with a real render.
+    delims = tuple(d.encode('utf-8') for d in (
+        jinja_engine.block_start_string,
+        jinja_engine.variable_start_string,
+        jinja_engine.comment_start_string
+    ))
+    # Opt-in disk-backed render cache, following the TMPL_YAML_CACHE /
+    # TMPL_MAPPING_CACHE pattern: keyed on the raw template bytes, the full
+    # configuration, the delimiter set, and the per-file render keys, so
+    # repeat runs over unchanged inputs skip the render entirely. Off by
+    # default since renders are not necessarily pure: the built-in
+    # read_file()/env()/get_output()/get_ip()/get_host() functions (and any
+    # library extension) pull from inputs outside the cache key, so cached
+    # output can go stale when those change.
+    render_cache_dir = None
+    conf_digest = b''
+    if os.getenv('TMPL_RENDER_CACHE') == '1':
+        import hashlib
+        import pickle
+        render_cache_dir = os.path.expanduser('~/.cache/tmpl')
+        try:
+            os.makedirs(render_cache_dir, exist_ok=True)
+            conf_digest = hashlib.sha256(pickle.dumps((conf, delims), protocol=pickle.HIGHEST_PROTOCOL)).digest()
+        except Exception:
+            render_cache_dir = None
+    def ensure_parent_dir(parent_dir: str, action: str, rel_dst: str):
+        if parent_dir and parent_dir not in created_dirs:
+            try:
+                os.makedirs(parent_dir, exist_ok=True)
+            except Exception as e:
+                raise Exception(f"Unable to {action} \"{rel_dst}\" to working directory - unable to create parent directory \"{parent_dir}\" - {e}")
+            created_dirs.add(parent_dir)
+    def translate_map(spec: dict, spec_map: dict):
+        full_src = spec_map['full_src']
+        full_wrk = spec_map['full_wrk']
+        rel_src = spec_map['rel_src']
+        rel_dst = spec_map['rel_dst']
+        if spec_map['translate']:
+            logging.info('Translating "%s" into "%s"...', full_src, full_wrk)
+            try:
+                with open(full_src, 'rb') as f:
+                    raw = f.read()
+            except Exception as e:
+                raise Exception(f"Unable to load template \"{rel_src}\" - {e}")
+            if b'\r' not in raw and not any(d in raw for d in delims):
+                ensure_parent_dir(os.path.dirname(full_wrk), 'write', rel_dst)
+                data = raw[:-1] if raw.endswith(b'\n') else raw
                 try:
-                    template = jinja_engine.get_template(spec_map['rel_src'])
-                except jinja2.TemplateSyntaxError as e:
-                    m = f"Unable to load template \"{spec_map['rel_src']}\" - syntax error on line {e.lineno} - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
+                    fd = os.open(full_wrk, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
+                        while data:
+                            data = data[os.write(fd, data):]
+                    finally:
+                        os.close(fd)
                 except Exception as e:
-                    m = f"Unable to load template \"{spec_map['rel_src']}\" - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
-                aug = conf.copy()
-                aug['file'] = os.path.basename(spec_map['rel_dst'])
-                aug['this'] = spec
-                logging.debug(f"Rendering template \"{spec_map['rel_src']}\"...")
+                    raise Exception(f"Unable to write \"{rel_dst}\" to working directory - {e}")
+                return
+            cache_path = None
+            if render_cache_dir is not None:
+                key_hash = hashlib.sha256(raw)
+                key_hash.update(conf_digest)
+                key_hash.update(pickle.dumps((os.path.basename(rel_dst), spec), protocol=pickle.HIGHEST_PROTOCOL))
+                cache_path = os.path.join(render_cache_dir, f'render-{key_hash.hexdigest()}.bin')
                 try:
-                    rendered = template.render(**aug)
-                except jinja2.TemplateSyntaxError as e:
-                    m = f"Unable to render template \"{spec_map['rel_src']}\" - syntax error on line {e.lineno} - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
-                except Exception as e:
-                    m = f"Unable to render template \"{spec_map['rel_src']}\" - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
-                parent_dir = os.path.dirname(spec_map['full_wrk'])
-                if not os.path.isdir(parent_dir):
+                    with open(cache_path, 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    pass
+                else:
+                    ensure_parent_dir(os.path.dirname(full_wrk), 'write', rel_dst)
                     try:
-                        os.makedirs(parent_dir)
+                        fd = os.open(full_wrk, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                        try:
+                            while data:
+                                data = data[os.write(fd, data):]
+                        finally:
+                            os.close(fd)
                     except Exception as e:
-                        m = f"Unable to write \"{spec_map['rel_dst']}\" to working directory - unable to create parent directory \"{parent_dir}\" - {e}"
-                        cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                        logging.critical(m)
-                        sys.exit(EC)
+                        raise Exception(f"Unable to write \"{rel_dst}\" to working directory - {e}")
+                    return
+            logging.debug('Loading template "%s"...', rel_src)
+            try:
+                template = templates.get(rel_src)
+                if template is None:
+                    template = jinja_engine.get_template(rel_src)
+                    templates[rel_src] = template
+            except jinja2.TemplateSyntaxError as e:
+                raise Exception(f"Unable to load template \"{rel_src}\" - syntax error on line {e.lineno} - {e}")
+            except Exception as e:
+                raise Exception(f"Unable to load template \"{rel_src}\" - {e}")
+            logging.debug('Rendering template "%s"...', rel_src)
+            # A ChainMap overlay presents the per-file keys on top of `conf`
+            # without copying the whole configuration for every file.
+            aug = collections.ChainMap({'file': os.path.basename(rel_dst), 'this': spec}, conf)
+            try:
+                rendered = template.render(aug)
+            except jinja2.TemplateSyntaxError as e:
+                raise Exception(f"Unable to render template \"{rel_src}\" - syntax error on line {e.lineno} - {e}")
+            except Exception as e:
+                raise Exception(f"Unable to render template \"{rel_src}\" - {e}")
+            ensure_parent_dir(os.path.dirname(full_wrk), 'write', rel_dst)
+            data = rendered.encode('utf-8')
+            if cache_path is not None:
                 try:
-                    with open(spec_map['full_wrk'], 'w') as f:
-                        f.write(rendered)
-                except Exception as e:
-                    m = f"Unable to write \"{spec_map['rel_dst']}\" to working directory - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
-            else:
-                logging.info(f"Copying \"{spec_map['full_src']}\" to \"{spec_map['full_wrk']}\"...")
-                parent_dir = os.path.dirname(spec_map['full_wrk'])
-                if not os.path.isdir(parent_dir):
-                    try:
-                        os.makedirs(parent_dir)
-                    except Exception as e:
-                        m = f"Unable to copy \"{spec_map['rel_dst']}\" to working directory - unable to create parent directory \"{parent_dir}\" - {e}"
-                        cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                        logging.critical(m)
-                        sys.exit(EC)
+                    tmp_file = f'{cache_path}.{os.getpid()}'
+                    with open(tmp_file, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_file, cache_path)
+                except Exception:
+                    pass
+            try:
+                fd = os.open(full_wrk, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
                 try:
-                    shutil.copyfile(spec_map['full_src'], spec_map['full_wrk'])
-                except Exception as e:
-                    m = f"Unable to copy \"{spec_map['rel_dst']}\" to working directory - {e}"
-                    cli.stderr(cli.fcolor(f'      ERROR: {m}', cli.C_RED))
-                    logging.critical(m)
-                    sys.exit(EC)
+                    while data:
+                        data = data[os.write(fd, data):]
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                raise Exception(f"Unable to write \"{rel_dst}\" to working directory - {e}")
+        else:
+            logging.info('Copying "%s" to "%s"...', full_src, full_wrk)
+            ensure_parent_dir(os.path.dirname(full_wrk), 'copy', rel_dst)
+            try:
+                # Working-tree files may be renamed straight into the output
+                # directory by the transfer step, so each must own its inode:
+                # a zero-copy hardlink here would alias the template source
+                # and expose it to the finalize step's chmod/chown.
+                shutil.copyfile(full_src, full_wrk)
+            except Exception as e:
+                raise Exception(f"Unable to copy \"{rel_dst}\" to working directory - {e}")
+    by_dst = collections.defaultdict(list)
+    for m in mapping:
+        by_dst[m['dst_key']].append(m)
+    jobs = []
+    for spec in conf['files']:
+        cli.stdout(cli.fsubstep(spec['dst']))
+        for spec_map in by_dst.get(spec['dst'], ()):
+            jobs.append((spec, spec_map))
+    cli.flush_stdout()
+    # Each distinct template is compiled once (the memo above), but ordering
+    # the jobs so renders of the same source run back-to-back keeps the
+    # compiled template hot instead of cycling through the set. Output
+    # destinations are all distinct, so the order is otherwise free.
+    jobs.sort(key=lambda j: j[1]['rel_src'])
+    # Below a handful of jobs the pool's spawn/teardown outweighs any
+    # overlap, so run them inline.
+    if len(jobs) < 4:
+        for (spec, spec_map) in jobs:
+            try:
+                translate_map(spec, spec_map)
+            except Exception as e:
+                _fail(str(e), EC)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [executor.submit(translate_map, spec, spec_map) for (spec, spec_map) in jobs]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                _fail(str(e), EC)
 
 
 def validate_environment(args: Any):
@@ -224,37 +346,43 @@ def validate_environment(args: Any):
     '''
     EC = 2
     logging.debug('Validating working environment...')
-    if not os.path.isfile(args.rsync_executable):
+    if args.use_rsync and not os.path.isfile(args.rsync_executable):
         bail(f'Specified rsync executable path "{args.rsync_executable}" does not exist.', EC)
     if args.base_dir and not os.path.isdir(args.base_dir):
         bail(f'Specified template base directory "{args.base_dir}" does not exist.', EC)
-    if not os.path.isfile(args.template_conf):
-        if not os.path.isdir(args.template_conf):
+    # A single stat distinguishes the file/directory/missing cases instead of
+    # back-to-back isfile/isdir probes.
+    try:
+        conf_st = os.stat(args.template_conf)
+    except OSError:
+        conf_st = None
+    if conf_st is None or not stat.S_ISREG(conf_st.st_mode):
+        if conf_st is None or not stat.S_ISDIR(conf_st.st_mode):
             bail(f'Specified template configuration path "{args.template_conf}" does not exist.', EC)
         else:
             logging.debug('Selecting a suitable template configuration file within the specified directory...')
-            files = [f for f in os.listdir(args.template_conf) if os.path.isfile(os.path.join(args.template_conf, f))]
+            with os.scandir(args.template_conf) as entries:
+                files = {e.name for e in entries if e.is_file()}
             (hostname, fqdn) = utils.get_hostname()
-            simple_matches = ['tmpl.yaml', 'tmpl.yml', f'{fqdn}.yaml', f'{fqdn}.yml', f'{hostname}.yaml', f'{hostname}.yml']
+            simple_matches = ('tmpl.yaml', 'tmpl.yml', f'{fqdn}.yaml', f'{fqdn}.yml', f'{hostname}.yaml', f'{hostname}.yml')
             if not files:
                 bail(f'Specified template configuration file directory "{args.template_conf}" does not contain any template configuration files.', EC)
-            elif any(x in files for x in simple_matches):
-                args.template_conf = os.path.join(
-                    args.template_conf,
-                    next(x for x in simple_matches if x in files)
-                )
-            elif any(((f.endswith('.yaml') or f.endswith('.yml')) and f.rsplit('.', 1)[0] in hostname) for f in files):
-                args.template_conf = os.path.join(
-                    args.template_conf,
-                    next(f for f in files if (f.endswith('.yaml') or f.endswith('.yml')) and f.rsplit('.', 1)[0] in hostname)
-                )
-            else:
+            chosen = next((x for x in simple_matches if x in files), None)
+            if chosen is None:
+                chosen = next((f for f in files if f.endswith(YAML_EXTS) and f.rsplit('.', 1)[0] in hostname), None)
+            if chosen is None:
                 bail(f'Specified template configuration file directory "{args.template_conf}" does not contain any selectable template configuration files.', EC)
+            args.template_conf = os.path.join(args.template_conf, chosen)
         logging.info(f'Automatically selected template configuration file "{args.template_conf}".')
-    if os.path.isfile(args.working_directory):
-        bail(f'Specified working directory "{args.working_directory}" is an existing file.', EC)
-    if os.path.isdir(args.working_directory):
+    try:
+        wrk_st = os.stat(args.working_directory)
+    except OSError:
+        wrk_st = None
+    if wrk_st is not None:
+        if not stat.S_ISDIR(wrk_st.st_mode):
+            bail(f'Specified working directory "{args.working_directory}" is an existing file.', EC)
         try:
+            import shutil
             shutil.rmtree(args.working_directory)
         except Exception as e:
             bail(f'Unable to delete previous working directory - {e}', EC)
@@ -268,6 +396,74 @@ def validate_environment(args: Any):
         return args.base_dir
 
 
+def _transfer_tree(src_dir: str, dst_dir: str, delete: bool, excludes: list, dry_run: bool):
+    '''
+    Moves the contents of the working directory into the output directory
+    in-process. Files are renamed when both directories share a filesystem
+    and copied otherwise. When delete is set, files under the output
+    directory that were not produced by this run (and are not excluded) are
+    removed.
+    '''
+    import shutil
+    src_root = src_dir.rstrip('/')
+    dst_root = dst_dir.rstrip('/')
+    transferred = set()
+    created_dirs = set()
+    for (root, dirs, files) in os.walk(src_root):
+        rel_root = os.path.relpath(root, src_root)
+        # Replicate directories up front (rsync -a keeps empty ones).
+        for d in dirs:
+            rel = d if rel_root == '.' else f'{rel_root}/{d}'
+            transferred.add(rel)
+            if dry_run:
+                continue
+            dst_path = f'{dst_root}/{rel}'
+            if dst_path not in created_dirs:
+                os.makedirs(dst_path, exist_ok=True)
+                created_dirs.add(dst_path)
+        for f in files:
+            rel = f if rel_root == '.' else f'{rel_root}/{f}'
+            transferred.add(rel)
+            if dry_run:
+                continue
+            src_path = f'{root}/{f}'
+            dst_path = f'{dst_root}/{rel}'
+            parent = os.path.dirname(dst_path)
+            if parent and parent not in created_dirs:
+                os.makedirs(parent, exist_ok=True)
+                created_dirs.add(parent)
+            try:
+                os.replace(src_path, dst_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copy2(src_path, dst_path)
+    if delete:
+        exclude_set = {x.strip('/') for x in excludes if x}
+        for (root, dirs, files) in os.walk(dst_root):
+            rel_root = os.path.relpath(root, dst_root)
+            dirs[:] = [d for d in dirs if (d if rel_root == '.' else f'{rel_root}/{d}') not in exclude_set]
+            for f in files:
+                rel = f if rel_root == '.' else f'{rel_root}/{f}'
+                if rel in transferred or rel in exclude_set:
+                    continue
+                if not dry_run:
+                    os.remove(f'{dst_root}/{rel}')
+        # Second, bottom-up pass drops directories emptied above (or already
+        # empty) that this run did not produce.
+        for (root, dirs, files) in os.walk(dst_root, topdown=False):
+            rel_root = os.path.relpath(root, dst_root)
+            if rel_root == '.' or rel_root in transferred:
+                continue
+            if any(rel_root == x or rel_root.startswith(f'{x}/') for x in exclude_set):
+                continue
+            if not dry_run:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+
 def write_output(args: Any, mapping: list[dict]):
     '''
     Transfers the newly generated files from the working directory to the specified output directory.
@@ -277,32 +473,55 @@ def write_output(args: Any, mapping: list[dict]):
     if args.dry_run: msg += ' (DRY RUN)'
     cli.stdout(cli.fstep(f'{msg}...'))
     logging.debug(f'{msg}...')
+    created_output = False
     if not os.path.isdir(args.output):
         msg = f'Creating output directory "{args.output}"...'
         cli.stdout(cli.fsubstep(msg))
+        cli.flush_stdout()
         logging.debug(msg)
         try:
-            if not args.dry_run: os.makedirs(args.output)
+            if not args.dry_run:
+                os.makedirs(args.output)
+                created_output = True
         except Exception as e:
             bail(f'Unable to create output directory - {e}', EC)
     msg = 'Transferring files to output directory...'
     cli.stdout(cli.fsubstep(msg))
     logging.debug(msg)
-    rsync_args = '-a -h --progress'
-    if args.delete: rsync_args += ' --delete'
-    if args.dry_run: rsync_args += ' --dry-run'
+    cli.flush_stdout()
+    if not args.use_rsync:
+        # An empty output directory (just created, or being fully replaced
+        # under --delete) on the same filesystem as the working directory can
+        # take the whole tree in a single rename instead of a per-file pass.
+        if not args.dry_run and (created_output or args.delete):
+            out_root = args.output.rstrip('/')
+            try:
+                if not os.listdir(out_root) and os.stat(args.working_directory).st_dev == os.stat(out_root).st_dev:
+                    os.rename(args.working_directory, out_root)
+                    _finalize_output(args, mapping)
+                    return
+            except OSError:
+                pass
+        try:
+            _transfer_tree(args.working_directory, args.output, args.delete, args.exclude, args.dry_run)
+        except Exception as e:
+            bail(f'Unable to transfer files to output directory - {e}', EC)
+        _finalize_output(args, mapping)
+        return
+    rsync_cmd = [args.rsync_executable, '-a', '-h', '--progress']
+    if args.delete: rsync_cmd.append('--delete')
+    if args.dry_run: rsync_cmd.append('--dry-run')
     if args.exclude and args.exclude[0]:
         for x in args.exclude:
-            rsync_args += ' --exclude ' + x
-    logging.debug(f'{rsync_args=}')
+            rsync_cmd.extend(('--exclude', x))
     rsync_src = args.working_directory.rstrip('/') + '/'
     logging.debug(f'{rsync_src}')
     rsync_dst = args.output.rstrip('/') + '/'
     logging.debug(f'{rsync_dst}')
+    rsync_cmd.extend((rsync_src, rsync_dst))
+    logging.debug(f'{rsync_cmd=}')
     try:
-        (rsync_output, rsync_ec) = utils.run_process(
-            f'{args.rsync_executable} {rsync_args} "{rsync_src}" "{rsync_dst}"'
-        )
+        (rsync_output, rsync_ec) = utils.run_process(rsync_cmd)
     except Exception as e:
         bail(f'Unable to transfer files to output directory - {e}', EC)
     logging.debug(f'{rsync_ec=}')
@@ -310,44 +529,62 @@ def write_output(args: Any, mapping: list[dict]):
     for l in rsync_output: logf(f'RSYNC OUTPUT: {l}')
     if rsync_ec:
         bail(f'Unable to transfer files to output directory - rsync subprocess returned non-zero exit code "{rsync_ec}"', EC)
+    _finalize_output(args, mapping)
+
+
+def _finalize_output(args: Any, mapping: list[dict]):
+    '''
+    Applies symlinks, ownership, and permissions to the transferred output
+    files.
+    '''
     EC = 10
     msg = 'Processing symlinks, ownership, and permissions...'
     cli.stdout(cli.fsubstep(msg))
     logging.debug(msg)
+    cli.flush_stdout()
+    ids_cache: dict = {}
+    symbolic_modes = collections.defaultdict(list)
+    dry_run = args.dry_run
+    do_chmod = args.chmod
+    do_chown = args.chown
+    do_symlinks = args.symlinks
     for m in mapping:
         full_dst = m['full_dst']
         chmod = m['chmod']
         chown = m['chown']
         symlink = m['full_lnk']
-        if args.chmod and chmod and not args.dry_run:
-            logging.debug(f'Setting permissions of "{full_dst}" to "{chmod}"...')
+        # Unquoted YAML values parse as ints; treat their digits as the
+        # string the user wrote, so `chmod: 644` means octal 644 exactly as
+        # the chmod binary would read it and `chown: 1000` is a numeric uid.
+        if chmod is not None and not isinstance(chmod, str):
+            chmod = str(chmod)
+        if chown is not None and not isinstance(chown, str):
+            chown = str(chown)
+        if do_chmod and chmod and not dry_run:
+            logging.debug('Setting permissions of "%s" to "%s"...', full_dst, chmod)
             try:
-                (chmod_output, chmod_ec) = utils.run_process(
-                    f'chmod {chmod} "{full_dst}"'
-                )
+                os.chmod(full_dst, int(chmod, 8))
+            except ValueError:
+                # Symbolic modes (e.g. "+x") are delegated to the chmod
+                # binary, batched into one invocation per distinct mode.
+                symbolic_modes[chmod].append(full_dst)
             except Exception as e:
                 bail(f'Unable to set permissions of "{full_dst}" to "{chmod}" - {e}', EC)
-            logging.debug(f'{chmod_ec=}')
-            logf = logging.critical if chmod_ec else logging.debug
-            for l in chmod_output: logf(f'CHMOD OUTPUT: {l}')
-            if chmod_ec:
-                bail(f'Unable to set permissions of "{full_dst}" to "{chmod}" - chmod subprocess returned non-zero exit code "{chmod_ec}"', EC)
-        if args.chown and chown and not args.dry_run:
-            logging.debug(f'Setting ownership of "{full_dst}" to "{chown}"...')
+        if do_chown and chown and not dry_run:
+            logging.debug('Setting ownership of "%s" to "%s"...', full_dst, chown)
             try:
-                (chown_output, chown_ec) = utils.run_process(
-                    f'chown {chown} "{full_dst}"'
-                )
+                if chown not in ids_cache:
+                    (user, _, group) = chown.partition(':')
+                    uid = (int(user) if user.isdigit() else pwd.getpwnam(user).pw_uid) if user else -1
+                    gid = (int(group) if group.isdigit() else grp.getgrnam(group).gr_gid) if group else -1
+                    ids_cache[chown] = (uid, gid)
+                (uid, gid) = ids_cache[chown]
+                os.chown(full_dst, uid, gid)
             except Exception as e:
                 bail(f'Unable to set ownership of "{full_dst}" to "{chown}" - {e}', EC)
-            logging.debug(f'{chown_ec=}')
-            logf = logging.critical if chown_ec else logging.debug
-            for l in chown_output: logf(f'CHOWN OUTPUT: {l}')
-            if chown_ec:
-                bail(f'Unable to set ownership of "{full_dst}" to "{chown}" - chown subprocess returned non-zero exit code "{chown_ec}"', EC)
-        if args.symlinks and symlink and not args.dry_run:
+        if do_symlinks and symlink and not dry_run:
             if os.path.islink(symlink):
-                logging.debug(f'Removing existing symlink "{symlink}" for file "{full_dst}"...')
+                logging.debug('Removing existing symlink "%s" for file "%s"...', symlink, full_dst)
                 try:
                     os.unlink(symlink)
                 except Exception as e:
@@ -356,13 +593,27 @@ def write_output(args: Any, mapping: list[dict]):
                 bail(f'Link destination "{symlink}" for file "{full_dst}" is an existing regular file or directory', EC)
             full_lnk_dir = os.path.dirname(symlink)
             if full_lnk_dir and not os.path.isdir(full_lnk_dir):
-                logging.debug(f'Creating parent directory of symlink "{symlink}" for "{full_dst}"...')
+                logging.debug('Creating parent directory of symlink "%s" for "%s"...', symlink, full_dst)
                 try:
                     os.makedirs(full_lnk_dir)
                 except Exception as e:
                     bail(f'Unable to create parent directory of symlink "{symlink}" for "{full_dst}" - {e}', EC)
-            logging.debug(f'Linking "{symlink}" to "{full_dst}"...')
+            logging.debug('Linking "%s" to "%s"...', symlink, full_dst)
             try:
                 os.symlink(full_dst, symlink)
             except Exception as e:
                 bail(f'Unable to create symlink "{symlink}" for "{full_dst}"...', EC)
+    for (mode, paths) in symbolic_modes.items():
+        logging.debug('Setting permissions of %d file(s) to "%s"...', len(paths), mode)
+        try:
+            chmod_proc = subprocess.run(
+                ['chmod', mode, *paths],
+                stdout = subprocess.PIPE,
+                stderr = subprocess.STDOUT
+            )
+        except Exception as e:
+            bail(f'Unable to set permissions to "{mode}" - {e}', EC)
+        if chmod_proc.returncode:
+            for l in chmod_proc.stdout.decode('ascii', 'ignore').splitlines():
+                logging.critical(f'CHMOD OUTPUT: {l}')
+            bail(f'Unable to set permissions to "{mode}" - chmod subprocess returned non-zero exit code "{chmod_proc.returncode}"', EC)
@@ -3,7 +3,8 @@
 Contains functions for interacting with the CLI.
 '''
 
-import argparse
+import atexit
+import functools
 import os
 import sys
 from typing import Any, Optional
@@ -24,6 +25,25 @@ HELP_EPILOG = """
 """
 SUPPRESS_OUTPUT = False
 
+# Default option values sourced from the environment, computed once at import.
+DEFAULT_BASE_DIR          = os.getenv('TMPL_BASE_DIR', '')
+DEFAULT_BLOCK_END_STR     = os.getenv('TMPL_BLOCK_END_STR', '%}')
+DEFAULT_BLOCK_START_STR   = os.getenv('TMPL_BLOCK_START_STR', '{%')
+DEFAULT_COMMENT_END_STR   = os.getenv('TMPL_COMMENT_END_STR', '#}')
+DEFAULT_COMMENT_START_STR = os.getenv('TMPL_COMMENT_START_STR', '{#')
+DEFAULT_EXCLUDE           = os.getenv('TMPL_EXCLUDE', '').split(' ')
+DEFAULT_LOG_FILE          = os.getenv('TMPL_LOG_FILE', '')
+DEFAULT_LOG_LEVEL         = os.getenv('TMPL_LOG_LEVEL', 'info')
+DEFAULT_LOG_MODE          = os.getenv('TMPL_LOG_MODE', 'append')
+DEFAULT_OUTPUT            = os.path.expanduser(os.getenv('TMPL_OUTPUT', os.getcwd()))
+DEFAULT_RSYNC_PATH        = os.getenv('TMPL_RSYNC_PATH', '/usr/bin/rsync')
+DEFAULT_VAR_END_STR       = os.getenv('TMPL_VAR_END_STR', '}}')
+DEFAULT_VAR_START_STR     = os.getenv('TMPL_VAR_START_STR', '{{')
+DEFAULT_WORKING_DIR       = os.getenv('TMPL_WORKING_DIR', '/tmp/tmpl')
+
+_VALID_LOG_LEVELS = frozenset(('info', 'debug'))
+_VALID_LOG_MODES  = frozenset(('append', 'overwrite'))
+
 
 def fcolor(instring: str, color: Optional[str] = C_BLUE) -> str:
     '''
@@ -35,10 +55,16 @@ def fcolor(instring: str, color: Optional[str] = C_BLUE) -> str:
         return instring
 
 
+_STEP_PREFIX    = C_BLUE + '::' + C_END + ' '
+_SUBSTEP_PREFIX = '  ' + C_BLUE + '-->' + C_END + ' '
+
+
 def fstep(instring: str, color: Optional[str] = C_BLUE) -> str:
     '''
     Formats the specified string as a "step".
     '''
+    if COLOR_OUTPUT and color is C_BLUE:
+        return _STEP_PREFIX + C_BOLD + instring + C_END
     return fcolor('::', color) + ' ' + fcolor(instring, C_BOLD)
 
 
@@ -46,6 +72,8 @@ def fsubstep(instring: str, color: Optional[str] = C_BLUE) -> str:
     '''
     Formats the specified string as a "sub-step".
     '''
+    if COLOR_OUTPUT and color is C_BLUE:
+        return _SUBSTEP_PREFIX + instring
     return '  ' + fcolor('-->', color) + ' ' + instring
 
 
@@ -56,21 +84,28 @@ def fsubsubstep(instring: str, color: Optional[str] = None) -> str:
     return '      ' + fcolor(instring, color)
 
 
-def parse_arguments() -> Any:
+def _help_formatter(prog: str) -> Any:
     '''
-    Parses the command-line arguments passed to the script, returning the
-    result.
+    Builds the help formatter used by the argument parser.
     '''
-    if not os.getenv('TMPL_LOG_LEVEL', 'info') in ['info', 'debug']:
-        sys.exit('Invalid value set for environment variable "TMPL_LOG_LEVEL".')
-    if not os.getenv('TMPL_LOG_MODE', 'append') in ['append', 'overwrite']:
-        sys.exit('Invalid value set for environment variable "TMPL_LOG_MODE".')
+    import argparse
+    return argparse.RawDescriptionHelpFormatter(prog, max_help_position=45, width=100)
+
+
+@functools.lru_cache(maxsize=1)
+def _build_parser() -> Any:
+    '''
+    Constructs the command-line argument parser, caching the result so repeated
+    invocations within the same process are a no-op. argparse itself is only
+    imported here, keeping it off the import path of library consumers.
+    '''
+    import argparse
     argparser = argparse.ArgumentParser(
         description = HELP_DESCRIPTION,
         epilog = HELP_EPILOG,
         usage = 'tmpl TEMPLATE_CONF [-o DEST] [...]',
         add_help = False,
-        formatter_class = lambda prog: argparse.RawDescriptionHelpFormatter(prog, max_help_position=45, width=100)
+        formatter_class = _help_formatter
     )
     argparser.add_argument(
         'template_conf',
@@ -79,35 +114,35 @@ def parse_arguments() -> Any:
     argparser.add_argument(
         '-b',
         '--base-dir',
-        default = os.getenv('TMPL_BASE_DIR', ''),
+        default = DEFAULT_BASE_DIR,
         dest = 'base_dir',
         help = '[env: TMPL_BASE_DIR] Specifies the base directory from which template files will be loaded. Defaults to the directory containing the specified template configuration file.',
         metavar = 'DIR'
     )
     argparser.add_argument(
         '--block-end-string',
-        default = os.getenv('TMPL_BLOCK_END_STR', '%}'),
+        default = DEFAULT_BLOCK_END_STR,
         dest = 'block_end_string',
         help = '[env: TMPL_BLOCK_END_STR] Specifies the string marking the end of a Jinja template block. Defaults to "%%}".',
         metavar = 'STR'
     )
     argparser.add_argument(
         '--block-start-string',
-        default = os.getenv('TMPL_BLOCK_START_STR', '{%'),
+        default = DEFAULT_BLOCK_START_STR,
         dest = 'block_start_string',
         help = '[env: TMPL_BLOCK_START_STR] Specifies the string marking the start of a Jinja template block. Defaults to "{%%".',
         metavar = 'STR'
     )
     argparser.add_argument(
         '--comment-end-string',
-        default = os.getenv('TMPL_COMMENT_END_STR', '#}'),
+        default = DEFAULT_COMMENT_END_STR,
         dest = 'comment_end_string',
         help = '[env: TMPL_COMMENT_END_STR] Specifies the string marking the end of a Jinja template comment. Defaults to "#}".',
         metavar = 'STR'
     )
     argparser.add_argument(
         '--comment-start-string',
-        default = os.getenv('TMPL_COMMENT_START_STR', '{#'),
+        default = DEFAULT_COMMENT_START_STR,
         dest = 'comment_start_string',
         help = '[env: TMPL_COMMENT_START_STR] Specifies the string marking the start of a Jinja template comment. Defaults to "{#".',
         metavar = 'STR'
@@ -133,7 +168,7 @@ def parse_arguments() -> Any:
     )
     argparser.add_argument(
         '--exclude',
-        default = os.getenv('TMPL_EXCLUDE', '').split(' '),
+        default = DEFAULT_EXCLUDE,
         dest = 'exclude',
         help = '[env: TMPL_EXCLUDE] Specifies an additional list of files or directories relative to the specified output directory that should be preserved on write (if "--delete" is supplied).',
         metavar = 'PATH',
@@ -148,7 +183,7 @@ def parse_arguments() -> Any:
     argparser.add_argument(
         '-f',
         '--log-file',
-        default = os.getenv('TMPL_LOG_FILE', ''),
+        default = DEFAULT_LOG_FILE,
         dest = 'log_file',
         help = '[env: TMPL_LOG_FILE] Specifies a log file to write to in addition to stdout/stderr.',
         metavar = 'FILE'
@@ -157,7 +192,7 @@ def parse_arguments() -> Any:
         '-l',
         '--log-level',
         choices = ['info', 'debug'],
-        default = os.getenv('TMPL_LOG_LEVEL', 'info'),
+        default = DEFAULT_LOG_LEVEL,
         dest = 'log_level',
         help = '[env: TMPLE_LOG_LEVEL] Specifies the log level of the script, being either "info" or "debug". Defaults to "info". This option is ignored if "--log-file" is not specified.',
         metavar = 'LVL'
@@ -166,7 +201,7 @@ def parse_arguments() -> Any:
         '-m',
         '--log-mode',
         choices = ['append', 'overwrite'],
-        default = os.getenv('TMPL_LOG_MODE', 'append'),
+        default = DEFAULT_LOG_MODE,
         dest = 'log_mode',
         help = '[env: TMPL_LOG_MODE] Specifies whether to "append" or "overwrite" the specified log file. Defaults to "append". This option is ignored if "--log-file" is not specified.',
         metavar = 'MODE'
@@ -198,18 +233,24 @@ def parse_arguments() -> Any:
     argparser.add_argument(
         '-o',
         '--output',
-        default = os.path.expanduser(os.getenv('TMPL_OUTPUT', os.getcwd())),
+        default = DEFAULT_OUTPUT,
         dest = 'output',
         help = '[env: TMPL_OUTPUT] Specifies the output directory of the generated files. Defaults to the current working directory.',
         metavar = 'DIR'
     )
     argparser.add_argument(
         '--rsync-executable',
-        default = os.getenv('TMPL_RSYNC_PATH', '/usr/bin/rsync'),
+        default = DEFAULT_RSYNC_PATH,
         dest = 'rsync_executable',
         help = '[env: TMPL_RSYNC_PATH] Specifies a file path to the rsync executable utilized for transferring directories. Defaults to "/usr/bin/rsync".',
         metavar = 'FILE'
     )
+    argparser.add_argument(
+        '--use-rsync',
+        action = 'store_true',
+        dest = 'use_rsync',
+        help = 'Specifies that the script should transfer generated files to the output directory via the rsync executable instead of the built-in in-process transfer.'
+    )
     argparser.add_argument(
         '--stdin',
         action = 'store_true',
@@ -218,14 +259,14 @@ def parse_arguments() -> Any:
     )
     argparser.add_argument(
         '--variable-end-string',
-        default = os.getenv('TMPL_VAR_END_STR', '}}'),
+        default = DEFAULT_VAR_END_STR,
         dest = 'variable_end_string',
         help = '[env: TMPL_VAR_END_STR] Specifies the string marking the end of a Jinja template variable. Defaults to "}}".',
         metavar = 'STR'
     )
     argparser.add_argument(
         '--variable-start-string',
-        default = os.getenv('TMPL_VAR_START_STR', '{{'),
+        default = DEFAULT_VAR_START_STR,
         dest = 'variable_start_string',
         help = '[env: TMPL_VAR_START_STR] Specifies the string marking the start of a Jinja template variable. Defaults to "{{".',
         metavar = 'STR'
@@ -233,12 +274,41 @@ def parse_arguments() -> Any:
     argparser.add_argument(
         '-w',
         '--working-directory',
-        default = os.getenv('TMPL_WORKING_DIR', '/tmp/tmpl'),
+        default = DEFAULT_WORKING_DIR,
         dest = 'working_directory',
         help = '[env: TMPL_WORKING_DIR] Specifies the working directory. Defaults to "/tmp/tmpl".',
         metavar = 'DIR'
     )
-    return argparser.parse_args()
+    return argparser
+
+
+def parse_arguments() -> Any:
+    '''
+    Parses the command-line arguments passed to the script, returning the
+    result.
+    '''
+    if not DEFAULT_LOG_LEVEL in _VALID_LOG_LEVELS:
+        sys.exit('Invalid value set for environment variable "TMPL_LOG_LEVEL".')
+    if not DEFAULT_LOG_MODE in _VALID_LOG_MODES:
+        sys.exit('Invalid value set for environment variable "TMPL_LOG_MODE".')
+    return _build_parser().parse_args()
+
+
+_STDOUT_BUFFER: list = []
+
+
+def flush_stdout():
+    '''
+    Writes any buffered STDOUT messages in a single call.
+    '''
+    if _STDOUT_BUFFER:
+        sys.stdout.write('\n'.join(_STDOUT_BUFFER) + '\n')
+        sys.stdout.flush()
+        _STDOUT_BUFFER.clear()
+
+
+# An unhandled exception must not swallow buffered user-facing messages.
+atexit.register(flush_stdout)
 
 
 def stderr(instring: str):
@@ -250,6 +320,6 @@ def stderr(instring: str):
 
 def stdout(instring: str):
     '''
-    Prints the specified message to STDOUT.
+    Buffers the specified message for printing to STDOUT.
     '''
-    if not SUPPRESS_OUTPUT: print(instring)
+    if not SUPPRESS_OUTPUT: _STDOUT_BUFFER.append(instring)
@@ -3,12 +3,65 @@
 Contains code pertaining to the template configuration file.
 '''
 
+import copy
+import itertools
 import logging
 import os
 import yaml
 
+from typing import Any
+
 from . import utils
 
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_REALPATH_CACHE: dict = {}
+
+_YAML_FILE_CACHE: dict = {}
+
+
+def load_yaml_file(path: str) -> Any:
+    '''
+    Parses the YAML file at the specified path, caching results keyed on the
+    file's mtime and size so shared includes and repeat invocations skip both
+    the read and the parse. Hits return a deep copy, since callers (notably
+    parse) mutate the result.
+    '''
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _YAML_FILE_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return copy.deepcopy(cached[1])
+    data = None
+    disk_cache = None
+    # Opt-in disk-backed cache so unchanged files skip the YAML parse across
+    # processes; unpickling a dict is much cheaper than re-parsing it.
+    if os.getenv('TMPL_YAML_CACHE') == '1':
+        import hashlib
+        import pickle
+        digest = hashlib.sha256(f'{path}|{key[0]}|{key[1]}'.encode()).hexdigest()
+        disk_cache = os.path.join(os.path.expanduser('~/.cache/tmpl'), f'yaml-{digest}.pkl')
+        try:
+            if os.path.isfile(disk_cache):
+                with open(disk_cache, 'rb') as f:
+                    data = pickle.load(f)
+        except Exception:
+            data = None
+    if data is None:
+        with open(path, 'rb') as f:
+            data = yaml.load(f, Loader=YAML_LOADER)
+        if disk_cache is not None:
+            try:
+                os.makedirs(os.path.dirname(disk_cache), exist_ok=True)
+                tmp_file = f'{disk_cache}.{os.getpid()}'
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, disk_cache)
+            except Exception:
+                pass
+    _YAML_FILE_CACHE[path] = (key, copy.deepcopy(data))
+    return data
+
 
 def compute_mapping(conf: dict, output_dir: str, working_dir: str) -> list[dict]:
     '''
@@ -29,24 +82,66 @@ def compute_mapping(conf: dict, output_dir: str, working_dir: str) -> list[dict]
     translate: Whether to translate the file as a template.
     '''
     logging.debug('Computing path mapping...')
+    # Opt-in persistent cache for repeat runs over an unchanged
+    # configuration. Keyed on the full inputs; stale entries are possible if
+    # the template tree itself changes, which is why this is off by default.
+    cache_file = None
+    if os.getenv('TMPL_MAPPING_CACHE') == '1':
+        import hashlib
+        import pickle
+        try:
+            digest = hashlib.sha256(pickle.dumps((conf, output_dir, working_dir))).hexdigest()
+            cache_file = os.path.join(os.path.expanduser('~/.cache/tmpl'), f'mapping-{digest}.pkl')
+            if os.path.isfile(cache_file):
+                with open(cache_file, 'rb') as f:
+                    return pickle.load(f)
+        except Exception:
+            cache_file = None
     mapping = []
+    # Bind the hot helpers and the template directory to locals so the
+    # per-spec loops use fast-local access instead of repeated attribute
+    # lookups.
+    _exists = os.path.exists
+    _get_path = utils.get_path
+    _parse_paths = utils.parse_file_paths
+    _relpath = utils.fast_relpath
+    _tmpl_dir = utils.TEMPLATE_DIR
+    # Both directories are validated absolute paths, so destination and
+    # working paths can be built by concatenation instead of os.path.join.
+    out_prefix = output_dir.rstrip(os.sep) + os.sep
+    wrk_prefix = working_dir.rstrip(os.sep) + os.sep
+    # Literal source specs are existence-checked against a set populated by a
+    # single walk of the template directory, so N specs cost one directory
+    # walk instead of N stats. Paths outside the walk fall back to a stat.
+    existing = None
+    def _src_exists(p: str) -> bool:
+        nonlocal existing
+        if existing is None:
+            existing = set()
+            if os.path.isdir(_tmpl_dir):
+                for (root, _, files) in os.walk(_tmpl_dir):
+                    for f in files:
+                        existing.add(root + os.sep + f)
+        return p in existing or _exists(p)
     for spec in conf['files']:
         spec_dst = spec['dst']
-        logging.debug(f'Computing template path mapping for "{spec_dst}"...')
+        logging.debug('Computing template path mapping for "%s"...', spec_dst)
         if 'src' in spec:
             logging.debug('TYPE: SRC')
             try:
-                spec_full_srcs = utils.parse_file_paths(utils.get_path(spec['src']))
+                spec_full_srcs = _parse_paths(_get_path(spec['src']))
             except Exception as e:
                 raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - {e}')
             if not spec_full_srcs:
                 raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - "src" does not resolve to any valid source paths')
-            spec_rel_srcs = [os.path.relpath(p, utils.TEMPLATE_DIR) for p in spec_full_srcs]
-            for p in spec_full_srcs:
-                if not os.path.exists(p):
-                    raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - "{p}" does not correspond to a path to an existing file')
+            # Globbed path specifications only ever resolve to existing files,
+            # so the stat-per-path check is only needed for literal paths.
+            if '*' not in spec['src']:
+                for p in spec_full_srcs:
+                    if not _src_exists(p):
+                        raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - "{p}" does not correspond to a path to an existing file')
             try:
-                spec_full_dsts = utils.parse_file_paths(utils.get_path(spec_dst, output_dir))
+                spec_full_dsts = _parse_paths(_get_path(spec_dst, output_dir))
             except Exception as e:
                 raise Exception(f'unable to compute template destination path mapping for "{spec_dst}" - {e}')
             if not spec_full_dsts:
@@ -54,20 +149,23 @@ def compute_mapping(conf: dict, output_dir: str, working_dir: str) -> list[dict]
             if len(spec_full_dsts) > 1:
                 raise Exception(f'unable to compute template destination path mapping for "{spec_dst}" - "dst" cannot contain expansion expressions if "src" is specified')
             spec_full_dst = spec_full_dsts[0]
-            spec_rel_dst = os.path.relpath(spec_full_dst, output_dir)
+            spec_rel_dst = _relpath(spec_full_dst, output_dir)
             spec_full_wrk = os.path.join(working_dir, spec_rel_dst)
             if 'symlink' in spec:
                 if len(spec_full_srcs) > 1:
                     raise Exception('unable to compute template symlink path mapping for "{spec_dst}" - "symlink" cannot be specified if "src" contains expansion expressions')
-                    spec_full_lnk = utils.get_path(spec['symlink'], output_dir)
-                    spec_rel_lnk = os.path.relpath(spec_full_lnk, output_dir)
+                    spec_full_lnk = _get_path(spec['symlink'], output_dir)
+                    spec_rel_lnk = _relpath(spec_full_lnk, output_dir)
             else:
                 spec_full_lnk = ''
                 spec_rel_lnk = ''
-            for (full_src, rel_src) in zip(spec_full_srcs, spec_rel_srcs):
+            spec_chmod = spec.get('chmod', '')
+            spec_chown = spec.get('chown', '')
+            spec_translate = spec.get('translate', True)
+            for full_src in spec_full_srcs:
                 mapping.append({
-                    'chmod':     spec['chmod'] if 'chmod' in spec else '',
-                    'chown':     spec['chown'] if 'chown' in spec else '',
+                    'chmod':     spec_chmod,
+                    'chown':     spec_chown,
                     'dst_key':   spec_dst,
                     'full_dst':  spec_full_dst,
                     'full_lnk':  spec_full_lnk,
@@ -75,50 +173,65 @@ def compute_mapping(conf: dict, output_dir: str, working_dir: str) -> list[dict]
                     'full_wrk':  spec_full_wrk,
                     'rel_dst':   spec_rel_dst,
                     'rel_lnk':   spec_rel_lnk,
-                    'rel_src':   rel_src,
-                    'translate': spec['translate'] if 'translate' in spec else True
+                    'rel_src':   _relpath(full_src, _tmpl_dir),
+                    'translate': spec_translate
                 })
         else:
             logging.debug('TYPE: DST')
             try:
-                spec_full_srcs = utils.parse_file_paths(utils.get_path(spec_dst))
+                spec_full_srcs = _parse_paths(_get_path(spec_dst))
             except Exception as e:
                 raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - {e}')
             if not spec_full_srcs:
                 raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - "dst" does not resolve to any valid source paths')
-            spec_rel_srcs = [os.path.relpath(p, utils.TEMPLATE_DIR) for p in spec_full_srcs]
-            for p in spec_full_srcs:
-                if not os.path.exists(p):
-                    raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - source path "{p}" does not exist')
-            spec_rel_dsts = spec_rel_srcs
-            spec_full_dsts = [os.path.join(output_dir, p) for p in spec_rel_dsts]
-            spec_full_wrks = [os.path.join(working_dir, p) for p in spec_rel_dsts]
+            # Globbed path specifications only ever resolve to existing files,
+            # so the stat-per-path check is only needed for literal paths.
+            if '*' not in spec_dst:
+                for p in spec_full_srcs:
+                    if not _src_exists(p):
+                        raise Exception(f'unable to compute template source path mapping for "{spec_dst}" - source path "{p}" does not exist')
             if 'symlink' in spec:
                 if len(spec_full_srcs) > 1:
                     raise Exception('unable to compute template symlink path mapping for "{spec_dst}" - "symlink" cannot be specified if "dst" contains expansion expressions')
-                spec_full_lnk = utils.get_path(spec['symlink'], output_dir)
-                spec_rel_lnk = os.path.relpath(spec_full_lnk, output_dir)
+                spec_full_lnk = _get_path(spec['symlink'], output_dir)
+                spec_rel_lnk = _relpath(spec_full_lnk, output_dir)
             else:
                 spec_full_lnk = ''
                 spec_rel_lnk = ''
-            for (full_dst, full_src, full_wrk, rel_dst, rel_src) in zip(spec_full_dsts, spec_full_srcs, spec_full_wrks, spec_rel_dsts, spec_rel_srcs):
+            spec_chmod = spec.get('chmod', '')
+            spec_chown = spec.get('chown', '')
+            spec_translate = spec.get('translate', True)
+            for full_src in spec_full_srcs:
+                rel_src = _relpath(full_src, _tmpl_dir)
                 mapping.append({
-                    'chmod':     spec['chmod'] if 'chmod' in spec else '',
-                    'chown':     spec['chown'] if 'chown' in spec else '',
+                    'chmod':     spec_chmod,
+                    'chown':     spec_chown,
                     'dst_key':   spec_dst,
-                    'full_dst':  full_dst,
+                    'full_dst':  out_prefix + rel_src,
                     'full_lnk':  spec_full_lnk,
                     'full_src':  full_src,
-                    'full_wrk':  full_wrk,
-                    'rel_dst':   rel_dst,
+                    'full_wrk':  wrk_prefix + rel_src,
+                    'rel_dst':   rel_src,
                     'rel_lnk':   spec_rel_lnk,
                     'rel_src':   rel_src,
-                    'translate': spec['translate'] if 'translate' in spec else True
+                    'translate': spec_translate
                 })
-    logging.debug('----- Path Mappings -----')
-    for line in yaml.dump(mapping).splitlines():
-        logging.debug(line)
-    logging.debug('-------------------------')
+    # Serializing the whole mapping to YAML is only worth doing when the
+    # debug output is actually going somewhere.
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('----- Path Mappings -----')
+        for line in yaml.dump(mapping).splitlines():
+            logging.debug(line)
+        logging.debug('-------------------------')
+    if cache_file is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = f'{cache_file}.{os.getpid()}'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception:
+            pass
     return mapping
 
 
@@ -128,11 +241,12 @@ def get_lib_paths(conf: dict) -> list[str]:
     specified template configuration dictionary.
     '''
     if not 'lib' in conf: return []
-    flatten = lambda L: [item for sublist in L for item in sublist]
     path_dir = os.path.dirname(conf['template_configuration_file'])
     logging.debug('Parsing library extension paths...')
     try:
-        flat_lib = flatten(utils.parse_file_paths(utils.get_path(p, path_dir)) for p in conf['lib'])
+        flat_lib = list(itertools.chain.from_iterable(
+            utils.parse_file_paths(utils.get_path(p, path_dir)) for p in conf['lib']
+        ))
     except Exception as e:
         raise Exception(f'unable to parse library extension paths - {e}')
     return flat_lib
@@ -143,17 +257,13 @@ def parse(path: str) -> dict:
     Recursively parses a template configuration file, iteratively merging all
     YAML data.
     '''
-    if not os.path.isfile(path):
-        raise Exception(f'template configuration file "{path}" does not exist')
-    logging.debug(f'Reading template configuration file "{path}"...')
+    logging.debug('Parsing template configuration file "%s"...', path)
     try:
-        with open(path, 'r') as f:
-            conf_raw = f.read()
-    except Exception as e:
+        data = load_yaml_file(path)
+    except (FileNotFoundError, IsADirectoryError):
+        raise Exception(f'template configuration file "{path}" does not exist')
+    except OSError as e:
         raise Exception(f'unable to open template configuration file "{path}" - {e}')
-    logging.debug(f'Parsing template configuration file "{path}"...')
-    try:
-        data = yaml.safe_load(conf_raw)
     except Exception as e:
         raise Exception(f'unable to parse template configuration file "{path}" - {e}')
     if not isinstance(data, dict):
@@ -161,38 +271,54 @@ def parse(path: str) -> dict:
     if not 'include' in data: return data
     if not isinstance(data['include'], list):
         raise Exception(f'template configuration file "{path}" include specification is not a list of path specifications')
-    logging.debug(f'Handling template configuration file "{path}" includes...')
-    flatten = lambda L: [item for sublist in L for item in sublist]
+    logging.debug('Handling template configuration file "%s" includes...', path)
     path_dir = os.path.dirname(path)
     try:
-        flat_includes = flatten(
+        flat_includes = list(itertools.chain.from_iterable(
             utils.parse_file_paths(utils.get_path(p, path_dir)) for p in data['include']
-        )
+        ))
     except Exception as e:
         raise Exception(f'template configuration file "{path}" include specification parsing error - {e}')
     for i in flat_includes:
         if not isinstance(i, str):
             raise Exception(f'template configuration file "{path}" include specification is not a list of path specifications')
-        idata = parse(i)
+    # Independent includes are IO- and parse-bound, so large include sets may
+    # optionally be parsed across processes. The merge itself stays on the
+    # main process since it is order-sensitive.
+    if len(flat_includes) > 4 and os.getenv('TMPL_PARALLEL_INCLUDES') == '1':
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(os.cpu_count(), len(flat_includes))) as pool:
+            parsed_includes = list(pool.map(parse, flat_includes))
+    else:
+        parsed_includes = [parse(i) for i in flat_includes]
+    for (i, idata) in zip(flat_includes, parsed_includes):
         try:
-            data = utils.merge_yaml_data(data, idata)
+            data = utils.merge_yaml_data_inplace(data, idata)
         except Exception as e:
             raise Exception(f'unable to merge data from template configuration file "{path}" include path "{i}" - {e}')
-    data['template_configuration_file'] = os.path.realpath(path)
+    rpath = _REALPATH_CACHE.get(path)
+    if rpath is None:
+        rpath = os.path.realpath(path)
+        _REALPATH_CACHE[path] = rpath
+    data['template_configuration_file'] = rpath
     return data
 
 
 def validate(conf: dict):
     logging.debug('Validating template configuration file(s) data...')
-    if 'files' in conf:
-        if not isinstance(conf['files'], list):
+    files = conf.get('files')
+    if files is not None:
+        if not isinstance(files, list):
             raise Exception('"files" key is not a list of specification dictionaries')
-        if any(not isinstance(t, dict) for t in conf['files']):
-            raise Exception('"files" key is not a list of specification dictionaries')
-        if any(not 'dst' in t for t in conf['files']):
-            raise Exception('one or more "files" specifications do not specify the "dst" key')
-    if 'lib' in conf:
-        if not isinstance(conf['lib'], list):
-            raise Exception('"lib" key is not a list of file path specifications')
-        if any(not isinstance(l, str) for l in conf['lib']):
+        for t in files:
+            if not isinstance(t, dict):
+                raise Exception('"files" key is not a list of specification dictionaries')
+            if not 'dst' in t:
+                raise Exception('one or more "files" specifications do not specify the "dst" key')
+    lib = conf.get('lib')
+    if lib is not None:
+        if not isinstance(lib, list):
             raise Exception('"lib" key is not a list of file path specifications')
+        for l in lib:
+            if not isinstance(l, str):
+                raise Exception('"lib" key is not a list of file path specifications')
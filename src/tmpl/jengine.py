@@ -8,19 +8,33 @@ import inspect
 import jinja2
 import logging
 import os
+import sys
+import tempfile
 from typing import Any
 
 from . import jfuncs
 
+_ENV_CACHE: dict = {}
+_LIB_CACHE: dict = {}
+
 def import_lib(jinja_engine: Any, path: str):
     '''
     Imports functions from the specified file path into the specified Jinja
     engine.
     '''
     modname = os.path.basename(path).split('.', 1)[0]
-    logging.debug(f'Importing library at "{path}" as "{modname}"...')
+    logging.debug('Importing library at "%s" as "%s"...', path, modname)
     if not os.path.isfile(path):
         raise Exception('library extension file at "{path}" does not exist')
+    # Libraries are cached by real path and modification time, so repeated
+    # runs within one process (library/daemon usage) never re-execute
+    # unchanged user code.
+    key = os.path.realpath(path)
+    mtime = os.path.getmtime(path)
+    cached = _LIB_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        jinja_engine.globals.update(cached[1])
+        return
     try:
         spec = importlib.util.spec_from_file_location(modname, path)
     except Exception as e:
@@ -29,28 +43,60 @@ def import_lib(jinja_engine: Any, path: str):
         mod = importlib.util.module_from_spec(spec)
     except Exception as e:
         raise Exception(f'unable to convert importlib spec of "{modname}" to module object - {e}')
+    # Register the module before execution so imports between libraries (and
+    # self-referential imports) resolve against the loaded instance.
+    sys.modules[spec.name] = mod
     try:
         spec.loader.exec_module(mod)
     except Exception as e:
+        sys.modules.pop(spec.name, None)
         raise Exception(f'unable to execute module "{modname}" - {e}')
-    for f in inspect.getmembers(mod, inspect.isfunction):
-        logging.debug('Importing module function "{f[0]}"...')
-        jinja_engine.globals[f[0]] = f[1]
+    funcs = dict(inspect.getmembers(mod, inspect.isfunction))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for name in funcs:
+            logging.debug('Importing module function "%s"...', name)
+    _LIB_CACHE[key] = (mtime, funcs)
+    jinja_engine.globals.update(funcs)
 
 
 def setup(args: Any, template_dir: str) -> Any:
     '''
-    Creates a new Jinja2 engine.
+    Creates a new Jinja2 engine, reusing a previously-built engine when the
+    delimiter configuration and template directory match. Compiled template
+    bytecode additionally persists across processes via a file system
+    bytecode cache.
     '''
+    env_key = (
+        args.block_end_string,
+        args.block_start_string,
+        args.comment_end_string,
+        args.comment_start_string,
+        args.trim_jinja_blocks,
+        args.variable_end_string,
+        args.variable_start_string,
+        template_dir
+    )
+    cached = _ENV_CACHE.get(env_key)
+    if cached is not None:
+        return cached
     logging.debug('Initializing Jinja2 file system loader...')
     try:
         fsloader = jinja2.FileSystemLoader(template_dir)
     except Exception as e:
         raise Exception(f'unable to initialize jinja2 file system loader - {e}')
+    try:
+        bcc_dir = os.path.join(tempfile.gettempdir(), f'tmpl-bcc-{os.getuid()}')
+        os.makedirs(bcc_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bcc_dir)
+    except Exception:
+        bytecode_cache = None
     logging.debug('Initializing Jinja2 engine...')
     jinja_engine = jinja2.Environment(
+        auto_reload           = False,
         block_end_string      = args.block_end_string,
         block_start_string    = args.block_start_string,
+        bytecode_cache        = bytecode_cache,
+        cache_size            = -1,
         comment_end_string    = args.comment_end_string,
         comment_start_string  = args.comment_start_string,
         extensions            = ['jinja2.ext.do', 'jinja2.ext.loopcontrols'],
@@ -60,9 +106,6 @@ def setup(args: Any, template_dir: str) -> Any:
         variable_start_string = args.variable_start_string
     )
     logging.debug('Importing custom Jinja functions...')
-    for f in inspect.getmembers(jfuncs, inspect.isfunction):
-        if f[0].startswith('t_'):
-            jname = f[0].split('_', 1)[1]
-            logging.debug(f'Importing custom function "{f[0]}" as "{jname}"...')
-            jinja_engine.globals[jname] = f[1]
+    jinja_engine.globals.update(jfuncs.T_FUNCS)
+    _ENV_CACHE[env_key] = jinja_engine
     return jinja_engine
@@ -3,12 +3,17 @@
 Contains the set of Jinja2 functions included with `tmpl`.
 '''
 
+import functools
 import jinja2
 import logging
 import os
 import socket
 import yaml
 
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_ENV_GET = os.environ.get
+
 from . import cli
 from . import utils
 
@@ -24,18 +29,14 @@ def t_env(name: str, default=None) -> str:
     '''
     A Jinja function that literally just calls os.getenv() under the hood.
     '''
-    return os.getenv(name, default)
+    return _ENV_GET(name, default)
 
 
 def t_file_ext(path: str) -> str:
     '''
     A Jinja function that returns the file extension of the specified path.
     '''
-    basename = os.path.basename(path)
-    if not '.' in basename:
-        return ''
-    else:
-        return basename.split('.', 1)[1]
+    return path.rpartition('/')[2].partition('.')[2]
 
 
 def t_file_name(path: str) -> str:
@@ -43,11 +44,7 @@ def t_file_name(path: str) -> str:
     A Jinja function that returns the file name (without the extension) of the
     specified path.
     '''
-    basename = os.path.basename(path)
-    if not '.' in basename:
-        return basename
-    else:
-        return basename.split('.', 1)[0]
+    return path.rpartition('/')[2].partition('.')[0]
 
 
 @jinja2.pass_context
@@ -61,22 +58,34 @@ def t_get(context, variable: str):
         raise Exception(f'get() : Unable to fetch value of "{variable}" - {e}')
 
 
+@functools.lru_cache(maxsize=1024)
+def _resolve_host(ip: str) -> str:
+    return socket.gethostbyaddr(ip)[0]
+
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_ip(host: str) -> str:
+    return socket.gethostbyname(host)
+
+
 def t_get_host(ip: str) -> str:
     '''
-    A Jinja function that returns the host of a particular IP.
+    A Jinja function that returns the host of a particular IP. Successful
+    lookups are cached for the lifetime of the process.
     '''
     try:
-        return socket.gethostbyaddr(ip)[0]
+        return _resolve_host(ip)
     except Exception as e:
         raise Exception(f'get_host() : Unable to obtain host for specified IP address "{ip}" - {e}')
 
 
 def t_get_ip(host: str) -> str:
     '''
-    A Jinja function that returns the IP of a particular host.
+    A Jinja function that returns the IP of a particular host. Successful
+    lookups are cached for the lifetime of the process.
     '''
     try:
-        return socket.gethostbyname(host)
+        return _resolve_ip(host)
     except Exception as e:
         raise Exception(f'get_ip() : Unable to obtain IP address for specified host "{host}" - {e}')
 
@@ -91,12 +100,24 @@ def t_get_output(cmd: str) -> str:
         raise Exception(f'get_output() : Unable to get output from command "{cmd}" - {e}')
 
 
+@functools.lru_cache(maxsize=2000)
+def _parse_yaml_cached(yaml_str: str):
+    return yaml.load(yaml_str, Loader=YAML_LOADER)
+
+
 def t_parse_yaml(yaml_str: str) -> str:
     '''
     A Jinja function that parses the specified YAML string.
+
+    Results are memoized per unique input string, so templates that re-parse
+    the same snippet across many renders only pay for the parse once. The
+    cached object is returned directly and should be treated as read-only.
+    Very large snippets bypass the cache so it never pins big documents.
     '''
     try:
-        return yaml.safe_load(yaml_str)
+        if len(yaml_str) > 65536:
+            return yaml.load(yaml_str, Loader=YAML_LOADER)
+        return _parse_yaml_cached(yaml_str)
     except Exception as e:
         raise Exception(f'parse_yaml() : Unable to parse YAML string - {e}')
 
@@ -105,30 +126,30 @@ def t_path_basename(path: str) -> str:
     '''
     Wrapper around `os.path.basename`.
     '''
-    try:
-        return os.path.basename(path)
-    except Exception as e:
-        raise Exception(f'path_basename() : {e}')
+    return path.rpartition('/')[2]
 
 
 def t_path_dirname(path: str) -> str:
     '''
     Wrapper around `os.path.dirname`.
     '''
-    try:
-        return os.path.dirname(path)
-    except Exception as e:
-        raise Exception(f'path_dirname() : {e}')
+    return os.path.dirname(path)
 
 
 def t_path_join(*paths) -> str:
     '''
-    Wrapper around `os.path.join`.
+    Joins the specified path components with os.path.join semantics (a later
+    absolute component discards everything before it).
     '''
-    try:
-        return os.path.join(*paths)
-    except Exception as e:
-        raise Exception(f'path_join() : {e}')
+    result = paths[0]
+    for p in paths[1:]:
+        if p.startswith('/'):
+            result = p
+        elif not result or result.endswith('/'):
+            result += p
+        else:
+            result += '/' + p
+    return result
 
 
 def t_print(message):
@@ -152,14 +173,24 @@ def t_read_file(path: str) -> str:
     the path to the template configuration file.
     '''
     actual_path = utils.get_path(path)
-    if not os.path.isfile(actual_path):
-        raise Exception(f'read_file() : Cannot read file "{actual_path}" - specified file path does not exist')
     try:
-        with open(actual_path, 'r') as f:
-            contents = f.read()
+        with open(actual_path, 'rb', buffering=0) as f:
+            raw = f.read()
+    except FileNotFoundError:
+        raise Exception(f'read_file() : Cannot read file "{actual_path}" - specified file path does not exist')
     except Exception as e:
         raise Exception(f'read_file() : Cannot read file "{actual_path}" - {e}')
-    return contents
+    return raw.decode('utf-8')
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_required(variables: tuple) -> tuple:
+    '''
+    Splits a tuple of require() variable names into (variable, top, sub)
+    triples, cached so repeated renders of the same template skip the string
+    work.
+    '''
+    return tuple((v,) + tuple(v.partition('.')[::2]) for v in variables)
 
 
 @jinja2.pass_context
@@ -171,13 +202,18 @@ def t_require(context, *variables):
     http://jinja.pocoo.org/docs/2.10/api/#the-context
     http://jinja.pocoo.org/docs/2.10/api/#jinja2.contextfilter
     '''
-    for variable in variables:
-        if '.' in variable:
-            splitvar = variable.split('.', 1)
-            if not splitvar[0] in context:
-                raise Exception(f'require() : Required variable "{splitvar[0]}" not found in within the context of "{context.name}"')
-            if not splitvar[1] in context[splitvar[0]]:
-                raise Exception(f'require() : Required variable "{variable}" not found in within the context of "{context.name}"')
-        else:
-            if not variable in context:
-                raise Exception(f'require() : Required variable "{variable}" not found in within the context of "{context.name}"')
+    for (variable, top, sub) in _split_required(variables):
+        if not top in context:
+            raise Exception(f'require() : Required variable "{top}" not found in within the context of "{context.name}"')
+        if sub and not sub in context[top]:
+            raise Exception(f'require() : Required variable "{variable}" not found in within the context of "{context.name}"')
+
+
+# Computed once at import so jengine.setup doesn't have to re-discover the
+# t_-prefixed functions with inspect.getmembers on every invocation. Keys are
+# the names the functions are exposed under within templates.
+T_FUNCS = {
+    name.split('_', 1)[1]: obj
+    for (name, obj) in list(globals().items())
+    if name.startswith('t_') and callable(obj)
+}
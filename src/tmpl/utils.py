@@ -1,27 +1,50 @@
 #!/usr/bin/env python3
 
+import functools
 import glob
 import logging
 import os
-import pathlib
-import re
+import shlex
 import socket
 import subprocess
 import sys
 from typing import Any
 
-LIST_REGEX = re.compile(
-    r'^[/\w\.\-\ ]*(?P<expr>\[(?P<inner>[/\w\.\-\ ,]+)\])[/\w\.\-\ ]*$'
-)
-RANGE_REGEX = re.compile(
-    r'^[/\w\.\-\ ]*(?P<expr>\[(?P<lower>\d+)\-(?P<upper>\d+)\])[/\w\.\-\ ]*$'
-)
 TEMPLATE_DIR = ''
 
+# Deleting the path-expansion metacharacters from a spec leaves it unchanged
+# exactly when the spec is a plain path, giving a single C-level scan on the
+# (overwhelmingly common) fast path.
+_METACHAR_TABLE = str.maketrans('', '', '*[]')
 
+
+def fast_relpath(path: str, start: str) -> str:
+    '''
+    Returns the relative path equivalent of os.path.relpath, skipping the
+    getcwd()-backed abspath normalization when both paths are already absolute.
+    '''
+    if not (path.startswith(os.sep) and start.startswith(os.sep)):
+        return os.path.relpath(path, start)
+    path_parts = [p for p in path.split(os.sep) if p]
+    start_parts = [p for p in start.split(os.sep) if p]
+    # "." and ".." segments need real normalization - defer those to
+    # os.path.relpath rather than treating them as literal components.
+    if not {'.', '..'}.isdisjoint(path_parts) or not {'.', '..'}.isdisjoint(start_parts):
+        return os.path.relpath(path, start)
+    common = 0
+    for (a, b) in zip(start_parts, path_parts):
+        if a != b: break
+        common += 1
+    parts = ['..'] * (len(start_parts) - common) + path_parts[common:]
+    return os.sep.join(parts) if parts else os.curdir
+
+
+@functools.lru_cache(maxsize=1)
 def get_hostname() -> tuple[str, str]:
     '''
-    Obtains the hostname and FQDN of the executing machine.
+    Obtains the hostname and FQDN of the executing machine. The result is
+    cached for the lifetime of the process, since getfqdn may involve a DNS
+    lookup.
     '''
     return (
         socket.gethostname().split('.', 1)[0],
@@ -35,16 +58,24 @@ def get_path(template_path: str, base_path: str = '') -> str:
     '''
     if template_path.startswith('/'):
         return template_path
-    elif template_path.startswith('~'):
+    return _resolve_path(template_path, base_path, TEMPLATE_DIR)
+
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_path(template_path: str, base_path: str, template_dir: str) -> str:
+    '''
+    Computes (and caches) the resolution of a relative or "~"-prefixed template
+    path against the specified base/template directories.
+    '''
+    if template_path.startswith('~'):
         return os.path.expanduser(template_path)
-    else:
-        if base_path:
-            if '../' in base_path:
-                return os.path.abspath(os.path.join(base_path, template_path))
-            else:
-                return os.path.normpath(os.path.join(base_path, template_path))
+    elif base_path:
+        if '../' in base_path:
+            return os.path.abspath(os.path.join(base_path, template_path))
         else:
-            return os.path.normpath(os.path.join(TEMPLATE_DIR, template_path))
+            return os.path.normpath(os.path.join(base_path, template_path))
+    else:
+        return os.path.normpath(os.path.join(template_dir, template_path))
 
 
 def merge_yaml_data(data1: Any, data2: Any) -> Any:
@@ -55,9 +86,7 @@ def merge_yaml_data(data1: Any, data2: Any) -> Any:
     if isinstance(data1, str) and isinstance(data2, str):
         return data2
     if isinstance(data1, list) and isinstance(data2, list):
-        return_list = data1.copy()
-        return_list.extend(data2.copy())
-        return return_list
+        return data1 + data2
     if isinstance(data1, dict) and isinstance(data2, dict):
         return_dict = data1.copy()
         for key, val in data2.items():
@@ -69,6 +98,37 @@ def merge_yaml_data(data1: Any, data2: Any) -> Any:
     return data2
 
 
+def merge_yaml_data_inplace(data1: Any, data2: Any) -> Any:
+    '''
+    Like merge_yaml_data, but mutates the first object where possible instead
+    of copying it at every recursion level. Intended for merge chains where
+    the inputs are discarded afterwards, such as configuration include
+    handling.
+    '''
+    if isinstance(data1, list) and isinstance(data2, list):
+        data1.extend(data2)
+        return data1
+    if not (isinstance(data1, dict) and isinstance(data2, dict)):
+        return data2
+    # An explicit worklist instead of recursion keeps deep configs from
+    # paying a Python call frame per nesting level.
+    stack = [(data1, data2)]
+    while stack:
+        (dst, src) = stack.pop()
+        for (key, val) in src.items():
+            if key in dst:
+                cur = dst[key]
+                if isinstance(cur, dict) and isinstance(val, dict):
+                    stack.append((cur, val))
+                elif isinstance(cur, list) and isinstance(val, list):
+                    cur.extend(val)
+                else:
+                    dst[key] = val
+            else:
+                dst[key] = val
+    return data1
+
+
 def parse_file_paths(path_spec: str) -> list[str]:
     '''
     Returns the equivalent list of file paths given a path specification.
@@ -82,66 +142,95 @@ def parse_file_paths(path_spec: str) -> list[str]:
     /foo/bar[1,2].txt  ->  [/foo/bar1.txt, /foo/bar2.txt]
     /foo/bar[1-3].txt  ->  [/foo/bar1.txt, /foo/bar2.txt, /foo/bar3.txt]
     '''
-    if not '*' in path_spec and not '[' in path_spec and not ']' in path_spec:
+    if len(path_spec.translate(_METACHAR_TABLE)) == len(path_spec):
         return [path_spec]
-    elif '*' in path_spec:
+    has_star = '*' in path_spec
+    has_brackets = '[' in path_spec and ']' in path_spec
+    if has_star:
         try:
             if not '**' in path_spec:
                 return glob.glob(path_spec)
-            elif path_spec.startswith('/'):
-                base_path = '/'
-                altered_path_spec = path_spec.lstrip('/')
-            else:
-                base_path = '.'
-                altered_path_spec = path_spec
-            return [f.as_posix() for f in pathlib.Path(base_path).glob(altered_path_spec) if f.is_file()]
+            # glob's recursive mode walks the tree with os.scandir; filtering
+            # with isfile keeps the files-only contract at one stat per match
+            # instead of pathlib's glob-stat plus is_file-stat.
+            return [p for p in glob.iglob(path_spec, recursive=True) if os.path.isfile(p)]
         except Exception as e:
             raise Exception(f'path specification globbing encountered an exception - {e}')
-    elif '[' in path_spec and ']' in path_spec:
-        paths = []
-        guts = path_spec.split('[', 1)[1]
-        if not ']' in guts:
-            raise Exception('path specification has its shoelaces crossed')
-        guts = guts.split(']', 1)[0]
-        if ',' in guts:
-            list_match = LIST_REGEX.match(path_spec)
-            if not list_match:
-                raise Exception('path specification does not contain a valid list expression')
-            expr = list_match.group('expr')
-            parts = expr[1:-1].split(',')
-            for p in parts:
-                if p:
-                    paths.append(path_spec.replace(expr, p))
-        elif '-' in guts:
-            range_match = RANGE_REGEX.match(path_spec)
-            if not range_match:
-                raise Exception('path specification does not contain a valid range expression')
-            expr = range_match.group('expr')
-            lb = int(range_match.group('lower'))
-            ub = int(range_match.group('upper'))
-            if not ub > lb:
-                raise Exception('upperbound in path specification range expression is not greater than the lowerbound')
-            for i in range(lb, ub + 1):
-                paths.append(path_spec.replace(expr, str(i)))
-        else:
-            raise Exception('path specification does not specify a range or list expression')
-        return paths
+    elif has_brackets:
+        return list(_expand_brackets(path_spec))
     else:
         raise Exception('path specification does not have balanced brackets')
 
 
-def run_process(cmd: str, splitlines=True) -> tuple:
+@functools.lru_cache(maxsize=1024)
+def _expand_brackets(path_spec: str) -> tuple:
+    '''
+    Expands the list/range bracket expression within the specified path
+    specification. The expansion is a pure string computation, so results are
+    memoized per unique specification.
+    '''
+    paths = []
+    lidx = path_spec.index('[')
+    ridx = path_spec.find(']', lidx)
+    if ridx < 0:
+        raise Exception('path specification has its shoelaces crossed')
+    prefix = path_spec[:lidx]
+    suffix = path_spec[ridx + 1:]
+    # Only a single bracket expression per specification is supported (see
+    # the README); anything left over would silently expand to bogus paths.
+    if ']' in prefix or '[' in suffix or ']' in suffix:
+        raise Exception('path specification contains more than one bracket expression')
+    guts = path_spec[lidx + 1:ridx]
+    if ',' in guts:
+        for p in guts.split(','):
+            if p:
+                paths.append(f'{prefix}{p}{suffix}')
+    elif '-' in guts:
+        (lower, _, upper) = guts.partition('-')
+        if not lower.isdigit() or not upper.isdigit():
+            raise Exception('path specification does not contain a valid range expression')
+        lb = int(lower)
+        ub = int(upper)
+        if not ub > lb:
+            raise Exception('upperbound in path specification range expression is not greater than the lowerbound')
+        for i in range(lb, ub + 1):
+            paths.append(f'{prefix}{i}{suffix}')
+    else:
+        raise Exception('path specification does not specify a range or list expression')
+    return tuple(paths)
+
+
+# Any character the shell assigns meaning beyond word-splitting. Quotes are
+# included so quoting/escaping semantics are always left to the shell rather
+# than approximated with shlex.
+_SHELL_METACHARS = frozenset(';&|$<>*?~`\'"(){}#\\\n')
+
+
+def run_process(cmd, splitlines=True) -> tuple:
     '''
     Runs the specified command as a subprocess, returning the output of the
     command (optionally not split by lines) and its exit code.
+
+    Commands supplied as argument lists, or as strings free of shell
+    metacharacters, are executed directly without forking an intermediate
+    shell. Anything else falls back to shell interpretation.
     '''
-    process = subprocess.Popen(
+    use_shell = False
+    if isinstance(cmd, str):
+        if _SHELL_METACHARS.isdisjoint(cmd):
+            try:
+                cmd = shlex.split(cmd)
+            except ValueError:
+                use_shell = True
+        else:
+            use_shell = True
+    process = subprocess.run(
         cmd,
         stdout = subprocess.PIPE,
         stderr = subprocess.STDOUT,
-        shell = True
+        shell = use_shell
     )
-    output = process.communicate()[0].decode('ascii', 'ignore')
+    output = process.stdout.decode('ascii', 'ignore')
     exit_code = process.returncode
     if splitlines:
         return (output.splitlines(), exit_code)
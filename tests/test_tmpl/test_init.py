@@ -0,0 +1,58 @@
+'''
+Tests the top-level tmpl module.
+'''
+
+import os
+
+import tmpl
+
+
+def _mktree(base, files):
+    for (rel, content) in files.items():
+        path = os.path.join(base, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def test_transfer_tree(tmp_path):
+    '''
+    Tests tmpl._transfer_tree()
+    '''
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    _mktree(src, {'a.txt': 'a', 'sub/b.txt': 'b'})
+    os.makedirs(os.path.join(src, 'empty'))
+    os.makedirs(dst)
+    tmpl._transfer_tree(src, dst, False, [], False)
+    assert open(os.path.join(dst, 'a.txt')).read()     == 'a'
+    assert open(os.path.join(dst, 'sub/b.txt')).read() == 'b'
+    assert os.path.isdir(os.path.join(dst, 'empty'))   == True
+
+
+def test_transfer_tree_delete(tmp_path):
+    '''
+    Tests tmpl._transfer_tree() with delete and excludes.
+    '''
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    _mktree(src, {'a.txt': 'a'})
+    _mktree(dst, {'stale.txt': 'x', 'keep/k.txt': 'k', 'gone/g.txt': 'g'})
+    tmpl._transfer_tree(src, dst, True, ['keep'], False)
+    assert open(os.path.join(dst, 'a.txt')).read()        == 'a'
+    assert open(os.path.join(dst, 'keep/k.txt')).read()   == 'k'
+    assert os.path.exists(os.path.join(dst, 'stale.txt')) == False
+    assert os.path.exists(os.path.join(dst, 'gone'))      == False
+
+
+def test_transfer_tree_dry_run(tmp_path):
+    '''
+    Tests tmpl._transfer_tree() with dry_run enabled.
+    '''
+    src = str(tmp_path / 'src')
+    dst = str(tmp_path / 'dst')
+    _mktree(src, {'a.txt': 'a'})
+    _mktree(dst, {'stale.txt': 'x'})
+    tmpl._transfer_tree(src, dst, True, [], True)
+    assert os.path.exists(os.path.join(dst, 'a.txt'))     == False
+    assert os.path.exists(os.path.join(dst, 'stale.txt')) == True
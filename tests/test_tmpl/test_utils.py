@@ -2,6 +2,10 @@
 Tests common utilities.
 '''
 
+import os
+
+import pytest
+
 from unittest.mock import patch
 
 from tmpl import utils
@@ -29,6 +33,15 @@ def test_get_path(mock_expand_user):
     assert utils.get_path('foo')         == '/tmp/src/foo'
     assert utils.get_path('bar', '/foo') == '/foo/bar'
 
+def test_fast_relpath():
+    '''
+    Tests utils.fast_relpath()
+    '''
+    assert utils.fast_relpath('/foo/bar/baz', '/foo') == 'bar/baz'
+    assert utils.fast_relpath('/foo/bar', '/foo/baz/qux') == '../../bar'
+    assert utils.fast_relpath('/foo', '/foo') == '.'
+    assert utils.fast_relpath('/a/c', '/a/b/..') == os.path.relpath('/a/c', '/a/b/..')
+
 def test_merge_yaml_data():
     '''
     Tests utils.merge_yaml_data()
@@ -39,6 +52,15 @@ def test_merge_yaml_data():
     assert utils.merge_yaml_data({'foo': True}, {'foo': False})              == { 'foo': False }
     assert utils.merge_yaml_data({'foo': ['a', 'b']}, {'foo': ['c']}) == { 'foo': ['a', 'b', 'c'] }
 
+def test_merge_yaml_data_inplace():
+    '''
+    Tests utils.merge_yaml_data_inplace()
+    '''
+    data = {'foo': ['a'], 'bar': {'x': 1}}
+    result = utils.merge_yaml_data_inplace(data, {'foo': ['b'], 'bar': {'y': 2}, 'baz': True})
+    assert result is data
+    assert result == {'foo': ['a', 'b'], 'bar': {'x': 1, 'y': 2}, 'baz': True}
+
 def test_parse_file_paths():
     '''
     Tests utils.parse_file_paths()
@@ -46,6 +68,8 @@ def test_parse_file_paths():
     assert utils.parse_file_paths('/foo/bar.txt')         == ['/foo/bar.txt']
     assert utils.parse_file_paths('/foo/bar-[a,b,c].txt') == ['/foo/bar-a.txt', '/foo/bar-b.txt', '/foo/bar-c.txt']
     assert utils.parse_file_paths('/foo/bar-[1-3].txt')   == ['/foo/bar-1.txt', '/foo/bar-2.txt', '/foo/bar-3.txt']
+    with pytest.raises(Exception):
+        utils.parse_file_paths('/foo/bar-[1,2]-[3,4].txt')
 
 def test_run_process():
     '''
@@ -53,3 +77,4 @@ def test_run_process():
     '''
     assert utils.run_process('python -c "print(\'test\')"')    == (['test'], 0)
     assert utils.run_process('python -c "print(\'test\')"', False) == ('test\n', 0)
+    assert utils.run_process(['echo', 'test'], False)          == ('test\n', 0)